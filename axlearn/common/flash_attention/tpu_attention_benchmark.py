@@ -12,39 +12,53 @@ Example run:
             --seq_len=65536 \
             --page_size=128
     Traced log dir can be specified with --trace-dir.
+    Pass --profile to also print HBM usage and the arithmetic intensity of each fwd pass.
+    By default, each config sweeps --block_sizes and reports the best one. Pass a single value
+    (e.g. --block_sizes=512) to skip the sweep, or --block_size_cache=<path>.json to reuse winners
+    from previous runs.
+    Each config runs the training path (--run_training), contiguous decoding and paged decoding
+    with each of --page_sizes, for each of --dtypes.
+    Each of these runs with full attention and with --sliding_window_size (0 to disable), and
+    reports the ratio of their flash times as sparse_speedup.
+    The reference and XLA baselines are timed once per run; only the flash kernel is swept.
+    Block sizes are ranked on flash_fused for training and flash_fwd for decoding.
 
-Sample outputs: (v5p)
-CMD: python \
-/opt/venv/lib/python3.10/site-packages/axlearn/common/flash_attention/tpu_attention_benchmark.py \
-2>&1 | grep -E "Benchmarking|ref_|HBM usage"
-
-Benchmarking attention representative of 1.2b model layer on TPU v5.
-ref_fwd:0.2291s, flash_fwd:0.0014s
-ref_bwd:0.0217s, flash_bwd:0.0058s
-Benchmarking attention representative of 12.6b model layer on TPU v5.
-ref_fwd:0.5699s, flash_fwd:0.0032s
-ref_bwd:0.0524s, flash_bwd:0.0152s
-Benchmarking attention representative of 29.6b model layer on TPU v5.
-ref_fwd:0.7957s, flash_fwd:0.0043s
-ref_bwd:0.0731s, flash_bwd:0.0204s
-Benchmarking attention representative of 65.2b model layer on TPU v5.
-ref_fwd:1.0225s, flash_fwd:0.0055s
-ref_bwd:0.0948s, flash_bwd:0.0262s
-Benchmarking attention representative of 134b model layer on TPU v5.
-ref_fwd:1.2485s, flash_fwd:0.0067s
-ref_bwd:0.1159s, flash_bwd:0.0313s
-Benchmarking attention representative of 261.7b model layer on TPU v5.
-ref_fwd:1.5577s, flash_fwd:0.0072s
-ref_bwd:0.1349s, flash_bwd:0.0373s
+Output format, per config (times in seconds; ref_bwd/ref_fused and flash_bwd/flash_fused are
+only printed for the training path, i.e. kv=None):
+CMD: python tpu_attention_benchmark.py 2>&1 | \
+    grep -E "Benchmarking|kv=|_fwd|_bwd|_fused|xla_vs_ref|block_size|sparse_speedup|HBM usage"
+
+Benchmarking attention representative of <config> model layer on <device_kind>.
+[kv=None ps=None dtype=bfloat16 sw=None]
+ref_fwd: <t>s
+xla_fwd:<t>s
+xla_vs_ref_max_abs_diff:<diff>
+ref_bwd:<t>s
+ref_fused:<t>s
+block_size=<block_size>
+flash_fwd:<t>s
+flash_bwd:<t>s
+flash_fused:<t>s
+...
+Best block_size=<block_size> for <cache_key>.
+[kv=None ps=None dtype=bfloat16 sw=4096]
+...
+sparse_speedup:<ratio>x
 """
+import functools
+import itertools
+import json
+import os
+import statistics
 import time
-from typing import Callable, Optional
+from typing import Callable, NamedTuple, Optional
 
 import jax
+import jax.numpy as jnp
 from absl import app, flags
 
-from axlearn.common.attention_bias import causal_mask
-from axlearn.common.flash_attention.common import ReferenceMHA
+from axlearn.common.attention_bias import BaseAttentionBias, causal_mask
+from axlearn.common.flash_attention.common import BaseFlashAttention, ReferenceMHA
 from axlearn.common.flash_attention.test_utils import (
     generate_attention_data,
     generate_paged_attention_data,
@@ -53,15 +67,45 @@ from axlearn.common.flash_attention.utils import flash_attention_implementation
 from axlearn.common.kv_cache.base_kv_cache import BaseKVCache
 from axlearn.common.kv_cache.kv_cache import KVCache
 from axlearn.common.kv_cache.paged_kv_cache import PagedKVCache
+from axlearn.common.utils import Nested, Tensor
 
 flags.DEFINE_boolean("enable_trace_profiling", False, "Whether to enable JAX trace profiling.")
 flags.DEFINE_string("trace_dir", "/tmp/axlearn_profiler", "Directory to save profiler traces.")
 flags.DEFINE_boolean("run_reference", True, "Whether to run the reference implementation.")
+flags.DEFINE_boolean(
+    "run_xla", True, "Whether to run jax.nn.dot_product_attention as an XLA baseline."
+)
 flags.DEFINE_string("config", None, "Configuration to run benchmark.")
 flags.DEFINE_integer("batch_size", 2, "Batch size for running benchmark.")
 flags.DEFINE_integer("seq_len", 8192, "Sequence length to run benchmark.")
+flags.DEFINE_boolean(
+    "run_training",
+    True,
+    "Whether to benchmark the training path (fwd, bwd and fused fwd+bwd) alongside decoding.",
+)
 flags.DEFINE_integer("page_size", None, "Page size for paged attention.")
-flags.DEFINE_integer("sliding_window_size", None, "Sliding window size for attention.")
+flags.DEFINE_list(
+    "page_sizes",
+    ["16", "64", "128"],
+    "Page sizes to benchmark paged attention with, unless --page_size is set.",
+)
+flags.DEFINE_integer(
+    "sliding_window_size",
+    4096,
+    "Sliding window size for attention, benchmarked against full attention. 0 to disable.",
+)
+flags.DEFINE_integer("num_iters", 20, "Number of timed iterations per kernel.")
+flags.DEFINE_boolean(
+    "clear_caches", False, "Whether to clear JAX caches before compiling each kernel."
+)
+flags.DEFINE_boolean(
+    "profile", False, "Whether to report HBM usage and arithmetic intensity of each kernel."
+)
+flags.DEFINE_list("dtypes", ["bfloat16", "float32"], "Input dtypes to benchmark.")
+flags.DEFINE_list("block_sizes", ["128", "256", "512", "1024"], "TPU block sizes to sweep.")
+flags.DEFINE_string(
+    "block_size_cache", None, "Optional JSON file caching the best block size for each config."
+)
 FLAGS = flags.FLAGS
 
 
@@ -99,25 +143,125 @@ _BENCHMARK_CONFIGS = {
 }
 
 
-def _time_call(fn: Callable, *, num_iters: int = 5) -> float:
-    """Times average execution time for fn call over num_iters after warmup."""
-    fn().block_until_ready()
-    tic = time.perf_counter()
+def _compile(fn: Callable, *args) -> Callable:
+    """Jits (if needed) and compiles fn ahead-of-time for args, so timing excludes compilation."""
+    if FLAGS.clear_caches:
+        # Compare against a cold cache, e.g. to rule out reuse of previously compiled kernels.
+        jax.clear_caches()
+    if not hasattr(fn, "lower"):
+        fn = jax.jit(fn)
+    return fn.lower(*args).compile()
+
+
+def _time_call(fn: Callable, *args, num_iters: Optional[int] = None) -> float:
+    """Times median execution time for precompiled fn(*args) over num_iters after warmup."""
+    num_iters = num_iters or FLAGS.num_iters
+    jax.block_until_ready(fn(*args))
     if FLAGS.enable_trace_profiling:
         jax.profiler.start_trace(FLAGS.trace_dir)
+    times = []
     for _ in range(num_iters):
-        fn().block_until_ready()
+        tic = time.perf_counter()
+        jax.block_until_ready(fn(*args))
+        times.append(time.perf_counter() - tic)
     if FLAGS.enable_trace_profiling:
         jax.profiler.stop_trace()
-    toc = time.perf_counter()
-    return (toc - tic) / num_iters
+    if FLAGS.profile:
+        _print_memory_stats()
+    return statistics.median(times)
 
 
-def _benchmark(
+def _print_memory_stats():
+    """Prints the HBM usage of the first device, if available.
+
+    The peak is the high-water mark since process start, not of the benchmarked call, so it is
+    labeled as process-wide.
+    """
+    stats = jax.devices()[0].memory_stats() or {}
+    names = dict(bytes_in_use="bytes_in_use", peak_bytes_in_use="process_peak_bytes_in_use")
+    usage = [f"{label}:{stats[key] / 2**30:.2f}GiB" for key, label in names.items() if key in stats]
+    if usage:
+        print(f"HBM usage: {', '.join(usage)}")
+
+
+def _print_fwd_intensity(
+    name: str, *, q: Tensor, k: Tensor, v: Tensor, kv_len: int, fwd_time: float
+):
+    """Prints the analytic arithmetic intensity of an attention fwd pass and achieved throughput.
+
+    FLOPs count the QK^T and PV matmuls without accounting for masking, and bytes count reading
+    q/k/v and writing the output once. Comparing the intensity against the device's FLOPs/bandwidth
+    ratio indicates whether the kernel is memory-bound or compute-bound.
+    """
+    batch_size, query_len, num_heads, per_head_dim = q.shape
+    flops = 4 * batch_size * num_heads * query_len * kv_len * per_head_dim
+    num_bytes = q.dtype.itemsize * (2 * q.size) + k.dtype.itemsize * (k.size + v.size)
+    print(
+        f"{name}_intensity:{flops / num_bytes:.2f}flops/byte, "
+        f"{num_bytes / fwd_time / 1e9:.2f}GB/s, {flops / fwd_time / 1e12:.2f}TFLOP/s"
+    )
+
+
+class _FloatInputs(NamedTuple):
+    """The attention inputs to differentiate with respect to."""
+
+    query: Tensor
+    key: Tensor
+    value: Tensor
+
+
+def _grad_impl(
+    impl: BaseFlashAttention, float_inputs: _FloatInputs, bias: BaseAttentionBias
+) -> Tensor:
+    """Returns the mean output of impl, as a scalar loss to differentiate."""
+    query, key, value = float_inputs
+    return impl(dict(query=query, key=key, value=value, bias=bias)).mean()
+
+
+def _make_bwd_fn(
+    impl: BaseFlashAttention, float_inputs: _FloatInputs, bias: BaseAttentionBias
+) -> tuple[Callable, tuple]:
+    """Returns a compiled fn running only the bwd pass of impl's mean output, and its args.
+
+    The fwd pass and its residuals are computed once by `jax.vjp`, outside of the returned fn, so
+    timing it measures the bwd pass alone.
+    """
+    loss, vjp_fn = jax.vjp(functools.partial(_grad_impl, impl, bias=bias), float_inputs)
+    args = (vjp_fn, jnp.ones_like(loss))
+    return _compile(lambda f, cotangent: f(cotangent), *args), args
+
+
+def _make_fused_fn(impl: BaseFlashAttention) -> Callable:
+    """Returns a jitted train-step-shaped fn computing impl's mean output and its grad.
+
+    XLA compiles the fwd and bwd passes as a single program, so comparing its time against fwd +
+    bwd shows the fusion benefit.
+
+    Returns:
+        A jitted fn taking (float_inputs: _FloatInputs, bias).
+    """
+    return jax.jit(jax.value_and_grad(functools.partial(_grad_impl, impl), argnums=0))
+
+
+def _xla_attention(input_batch: Nested[Tensor], *, softmax_scale: float) -> Tensor:
+    """Computes attention with `jax.nn.dot_product_attention`, i.e. XLA's fused attention.
+
+    The mask is taken from the explicit bias rather than `is_causal`, since the latter assumes
+    query and key positions are aligned, which does not hold when decoding.
+    """
+    query = input_batch["query"]
+    bias = input_batch["bias"].value()
+    if bias is not None:
+        bias = bias.astype(query.dtype)
+    return jax.nn.dot_product_attention(
+        query, input_batch["key"], input_batch["value"], bias=bias, scale=softmax_scale
+    )
+
+
+def _generate_inputs(
     *,
     batch_size: int,
     seq_len: int,
-    block_size: int,
     num_heads: int,
     per_head_dim: int,
     num_kv_heads: Optional[int] = None,
@@ -126,13 +270,18 @@ def _benchmark(
     use_bias: bool = False,
     sliding_window_size: Optional[int] = None,
     page_size: Optional[int] = None,
-):
-    """Benchmarks TPU FlashAttention vs reference impl."""
+    dtype: jnp.dtype = jnp.bfloat16,
+) -> tuple[Nested[Tensor], Optional[type[BaseKVCache]]]:
+    """Generates the attention input batch to benchmark.
+
+    Returns:
+        A tuple (input_batch, kv_cache_type), where kv_cache_type is PagedKVCache if page_size is
+        not None.
+    """
     if not (kv_cache_type is None or kv_cache_type in (KVCache, PagedKVCache)):
         raise NotImplementedError(f"This benchmark doesn't support {kv_cache_type=} yet.")
     if page_size is not None:
         kv_cache_type = PagedKVCache
-        assert page_size is not None
         q, k, v, page_tables, bias = generate_paged_attention_data(
             batch_size=batch_size,
             query_len=1,
@@ -144,6 +293,7 @@ def _benchmark(
             mask_fn=causal_mask if causal and not sliding_window_size else None,
             sliding_window_sz=sliding_window_size,
             attention_bias_type="4d" if use_bias else None,
+            dtype=dtype,
             query_offset=seq_len - 1,
         )
     else:
@@ -158,63 +308,172 @@ def _benchmark(
             mask_fn=causal_mask if causal and not sliding_window_size else None,
             sliding_window_sz=sliding_window_size,
             attention_bias_type="4d" if use_bias else None,
+            dtype=dtype,
             query_offset=seq_len - 1 if is_decoding else 0,
         )
         page_tables = None
+    input_batch = dict(query=q, key=k, value=v, bias=bias, page_tables=page_tables)
+    return input_batch, kv_cache_type
 
-    softmax_scale = q.shape[-1] ** 0.5
-    # Get fwd & bwd timing information when softmax scaling applied before calling the kernel.
-    ref_mha_impl = (
-        ReferenceMHA.default_config()
-        .set(softmax_scale=softmax_scale, tpu_block_size=block_size)
-        .instantiate()
-    )
+
+def _softmax_scale(input_batch: Nested[Tensor]) -> float:
+    """Returns the standard 1/sqrt(d) scale, applied to the logits by the kernels.
+
+    As a Python float (and part of each impl's config) it is a compile-time constant rather than a
+    traced value.
+    """
+    return 1.0 / input_batch["query"].shape[-1] ** 0.5
+
+
+def _benchmark_baselines(
+    input_batch: Nested[Tensor], *, kv_cache_type: Optional[type[BaseKVCache]]
+) -> dict[str, float]:
+    """Benchmarks the reference and XLA baselines, which do not depend on the block size.
+
+    Returns:
+        A dict mapping timing names (e.g. "ref_fwd") to median times in seconds.
+    """
+    softmax_scale = _softmax_scale(input_batch)
+    timings = {}
+    if FLAGS.run_reference:
+        ref_mha_impl = ReferenceMHA.default_config().set(softmax_scale=softmax_scale).instantiate()
+        ref_fwd_fn = _compile(lambda b: ref_mha_impl(b), input_batch)
+        ref_fwd_time = _time_call(ref_fwd_fn, input_batch)
+        print(f"ref_fwd: {ref_fwd_time:.4f}s")
+        timings["ref_fwd"] = ref_fwd_time
+
+    # The XLA baseline does not support the paged KV layout.
+    if FLAGS.run_xla and input_batch["page_tables"] is None:
+        xla_fwd_fn = _compile(
+            functools.partial(_xla_attention, softmax_scale=softmax_scale), input_batch
+        )
+        xla_fwd_time = _time_call(xla_fwd_fn, input_batch)
+        print(f"xla_fwd:{xla_fwd_time:.4f}s")
+        timings["xla_fwd"] = xla_fwd_time
+        if FLAGS.run_reference:
+            # ReferenceMHA serves as a correctness check for the XLA baseline.
+            diff = jnp.abs(
+                xla_fwd_fn(input_batch).astype(jnp.float32)
+                - ref_fwd_fn(input_batch).astype(jnp.float32)
+            )
+            print(f"xla_vs_ref_max_abs_diff:{float(jnp.max(diff)):.4e}")
+
+    if kv_cache_type is None and FLAGS.run_reference:
+        float_inputs = _FloatInputs(
+            query=input_batch["query"], key=input_batch["key"], value=input_batch["value"]
+        )
+        bias = input_batch["bias"]
+        ref_bwd_fn, ref_bwd_args = _make_bwd_fn(ref_mha_impl, float_inputs, bias)
+        ref_bwd_time = _time_call(ref_bwd_fn, *ref_bwd_args)
+        print(f"ref_bwd:{ref_bwd_time:.4f}s")
+        timings["ref_bwd"] = ref_bwd_time
+        ref_fused_fn = _compile(_make_fused_fn(ref_mha_impl), float_inputs, bias)
+        ref_fused_time = _time_call(ref_fused_fn, float_inputs, bias)
+        print(f"ref_fused:{ref_fused_time:.4f}s")
+        timings["ref_fused"] = ref_fused_time
+    return timings
+
+
+def _benchmark(
+    input_batch: Nested[Tensor],
+    *,
+    block_size: int,
+    kv_cache_type: Optional[type[BaseKVCache]],
+) -> Optional[dict[str, float]]:
+    """Benchmarks the TPU FlashAttention kernel with the given block size.
+
+    Returns:
+        A dict mapping timing names (e.g. "flash_fwd") to median times in seconds, or None if no
+        TPU kernel supports the block size for these inputs.
+    """
+    q, k, v = input_batch["query"], input_batch["key"], input_batch["value"]
+    bias, page_tables = input_batch["bias"], input_batch["page_tables"]
     mha_impl = flash_attention_implementation(
         "tpu",
         query=q,
         key=k,
         value=v,
         bias=bias,
-        softmax_scale=softmax_scale,
+        softmax_scale=_softmax_scale(input_batch),
         tpu_block_size=block_size,
         kv_cache_type=kv_cache_type,
         page_tables=page_tables,
     )
+    if mha_impl is None:
+        print(f"Skipping unsupported block_size={block_size}.")
+        return None
 
-    input_batch = dict(query=q, key=k, value=v, bias=bias, page_tables=page_tables)
-    if FLAGS.run_reference:
-        ref_mha_impl = (
-            ReferenceMHA.default_config()
-            .set(softmax_scale=softmax_scale, tpu_block_size=block_size)
-            .instantiate()
-        )
-        ref_fwd_time = _time_call(lambda: ref_mha_impl(input_batch))
-        print(f"ref_fwd: {ref_fwd_time:.4f}s")
-
-    flash_fwd_time = _time_call(lambda: mha_impl(input_batch))
+    timings = {}
+    flash_fwd_fn = _compile(lambda b: mha_impl(b), input_batch)
+    flash_fwd_time = _time_call(flash_fwd_fn, input_batch)
     print(f"flash_fwd:{flash_fwd_time:.4f}s")
+    timings["flash_fwd"] = flash_fwd_time
+    if FLAGS.profile:
+        kv_len = k.shape[1] if page_tables is None else page_tables.shape[1] * k.shape[2]
+        _print_fwd_intensity("flash_fwd", q=q, k=k, v=v, kv_len=kv_len, fwd_time=flash_fwd_time)
 
     if kv_cache_type is None:
+        float_inputs = _FloatInputs(query=q, key=k, value=v)
+        flash_bwd_fn, flash_bwd_args = _make_bwd_fn(mha_impl, float_inputs, bias)
+        flash_bwd_time = _time_call(flash_bwd_fn, *flash_bwd_args)
+        print(f"flash_bwd:{flash_bwd_time:.4f}s")
+        timings["flash_bwd"] = flash_bwd_time
+        flash_fused_fn = _compile(_make_fused_fn(mha_impl), float_inputs, bias)
+        flash_fused_time = _time_call(flash_fused_fn, float_inputs, bias)
+        print(f"flash_fused:{flash_fused_time:.4f}s")
+        timings["flash_fused"] = flash_fused_time
+    return timings
 
-        def grad_test(float_inputs, aux_inputs):
-            full_batch = {**float_inputs, **aux_inputs}
-            return mha_impl(full_batch).mean()
 
-        if FLAGS.run_reference:
+def _flash_time(timings: Optional[dict[str, float]]) -> Optional[float]:
+    """Returns the flash time to rank block sizes on, or None if timings is None.
 
-            def grad_ref(float_inputs, aux_inputs):
-                full_batch = {**float_inputs, **aux_inputs}
-                return ref_mha_impl(full_batch).mean()
+    This is the fused fwd+bwd time when benchmarking training, else the fwd time. Summing the
+    timings would double count, since the fused time already includes fwd and bwd.
+    """
+    if timings is None:
+        return None
+    return timings.get("flash_fused", timings["flash_fwd"])
 
-            ref_grad_fn = jax.jit(jax.grad(grad_ref, argnums=0))
-            ref_bwd_time = _time_call(lambda: ref_grad_fn(float_inputs, aux_inputs)["query"])
-            print(f"ref_bwd:{ref_bwd_time:.4f}s")
 
-        float_inputs = dict(query=q, key=k, value=v)
-        aux_inputs = dict(bias=bias)
-        flash_grad_fn = jax.jit(jax.grad(grad_test, argnums=0))
-        flash_bwd_time = _time_call(lambda: flash_grad_fn(float_inputs, aux_inputs)["query"])
-        print(f"flash_bwd:{flash_bwd_time:.4f}s")
+def _sweep_block_size(
+    cache_key: str, input_batch: Nested[Tensor], *, block_sizes: list[int], **kwargs
+) -> tuple[Optional[int], Optional[float]]:
+    """Benchmarks the flash kernel with each of block_sizes and returns the fastest one.
+
+    If `--block_size_cache` is set, previously found winners are reused and the sweep is skipped.
+    Block sizes that no TPU kernel supports for the inputs (e.g. ones that do not divide the
+    sequence length) are skipped.
+
+    Returns:
+        A tuple (block_size, flash_time) of the best block size and its `_flash_time`, or
+        (None, None) if none of block_sizes is supported.
+    """
+    cache = {}
+    if FLAGS.block_size_cache and os.path.exists(FLAGS.block_size_cache):
+        with open(FLAGS.block_size_cache, encoding="utf-8") as f:
+            cache = json.load(f)
+    if cache_key in cache:
+        block_size = cache[cache_key]
+        print(f"Using cached block_size={block_size} for {cache_key}.")
+        return block_size, _flash_time(_benchmark(input_batch, block_size=block_size, **kwargs))
+
+    best_block_size, best_time = None, None
+    for block_size in block_sizes:
+        print(f"block_size={block_size}")
+        flash_time = _flash_time(_benchmark(input_batch, block_size=block_size, **kwargs))
+        if flash_time is not None and (best_time is None or flash_time < best_time):
+            best_block_size, best_time = block_size, flash_time
+    if best_block_size is None:
+        print(f"No supported block_size in {block_sizes} for {cache_key}.")
+        return None, None
+    print(f"Best block_size={best_block_size} for {cache_key}.")
+
+    if FLAGS.block_size_cache:
+        cache[cache_key] = best_block_size
+        with open(FLAGS.block_size_cache, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+    return best_block_size, best_time
 
 
 def main(_):
@@ -225,17 +484,57 @@ def main(_):
     else:
         # Run Sweep without benchmarking 539.5b
         config_list = [(k, v) for k, v in _BENCHMARK_CONFIGS.items() if k != "539.5b"]
-    for name, cfg in config_list:
+    # Block sizes must not exceed the sequence length.
+    block_sizes = [int(bs) for bs in FLAGS.block_sizes if int(bs) <= FLAGS.seq_len]
+    # Compare contiguous decoding against paged decoding with each page size. A kv_cache_type of
+    # None benchmarks the training path.
+    page_sizes = [FLAGS.page_size] if FLAGS.page_size else [int(ps) for ps in FLAGS.page_sizes]
+    kv_cache_list = [(KVCache, None)] + [(PagedKVCache, ps) for ps in page_sizes]
+    if FLAGS.run_training:
+        kv_cache_list.insert(0, (None, None))
+    dtypes = [jnp.dtype(dtype) for dtype in FLAGS.dtypes]
+    # Compare full attention against sliding window attention. The window size is a static field
+    # of SlidingWindowAttentionBias, so kernels are specialized to it at compile time and can skip
+    # fully masked blocks.
+    sliding_window_sizes = [None]
+    if FLAGS.sliding_window_size:
+        sliding_window_sizes.append(FLAGS.sliding_window_size)
+    for i, (name, cfg) in enumerate(config_list):
+        if i > 0:
+            # No two configs share attention shapes, so kernels compiled for the previous config
+            # will not be used again. Clearing the caches bounds memory across the sweep.
+            jax.clear_caches()
         print(f"Benchmarking attention representative of {name} model layer on {device_kind}.")
-        _benchmark(
-            batch_size=FLAGS.batch_size,
-            seq_len=FLAGS.seq_len,
-            block_size=4 * 128,
-            sliding_window_size=FLAGS.sliding_window_size,
-            page_size=FLAGS.page_size,
-            kv_cache_type=KVCache,
-            **cfg,
-        )
+        for (kv_cache_type, page_size), dtype in itertools.product(kv_cache_list, dtypes):
+            kv_name = kv_cache_type.__name__ if kv_cache_type is not None else None
+            flash_times = {}
+            for sliding_window_size in sliding_window_sizes:
+                print(f"[kv={kv_name} ps={page_size} dtype={dtype.name} sw={sliding_window_size}]")
+                cache_key = (
+                    f"{device_kind}/{name}/batch_size={FLAGS.batch_size}/seq_len={FLAGS.seq_len}"
+                    f"/kv={kv_name}/page_size={page_size}/dtype={dtype.name}"
+                    f"/sliding_window_size={sliding_window_size}"
+                )
+                input_batch, run_kv_cache_type = _generate_inputs(
+                    batch_size=FLAGS.batch_size,
+                    seq_len=FLAGS.seq_len,
+                    sliding_window_size=sliding_window_size,
+                    page_size=page_size,
+                    kv_cache_type=kv_cache_type,
+                    dtype=dtype,
+                    **cfg,
+                )
+                # Baselines do not depend on the block size, so only the flash kernel is swept.
+                _benchmark_baselines(input_batch, kv_cache_type=run_kv_cache_type)
+                _, flash_times[sliding_window_size] = _sweep_block_size(
+                    cache_key,
+                    input_batch,
+                    block_sizes=block_sizes,
+                    kv_cache_type=run_kv_cache_type,
+                )
+            if FLAGS.sliding_window_size and None not in flash_times.values():
+                sparse_speedup = flash_times[None] / flash_times[FLAGS.sliding_window_size]
+                print(f"sparse_speedup:{sparse_speedup:.2f}x")
 
 
 if __name__ == "__main__":
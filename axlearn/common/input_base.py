@@ -2,29 +2,39 @@
 
 """Base Input interface."""
 
+import functools
 import math
+import queue
 import re
-from typing import Iterable, Iterator, NamedTuple, Optional, Protocol, Union
+import threading
+from typing import Iterable, Iterator, NamedTuple, Optional, Protocol, TypeVar, Union
 
 import jax
 from absl import logging
 from jax._src.mesh import thread_resources
-from jax.sharding import PartitionSpec
+from jax.sharding import NamedSharding, PartitionSpec
 
 from axlearn.common.config import ConfigOr, config_class, maybe_instantiate, maybe_set_config
 from axlearn.common.input_dispatch import BaseInputDispatcher, InputDispatcher
-from axlearn.common.module import Module
+from axlearn.common.module import (
+    InvocationContext,
+    Module,
+    clone_context_stack,
+    install_context_stack,
+)
 from axlearn.common.utils import (
     Nested,
     Tensor,
+    _key_entry_to_str,
     as_numpy_array,
     dispatch_input_batch,
     input_partition_spec,
-    tree_paths,
-    with_sharding_constraint,
 )
 
 
+_T = TypeVar("_T")
+
+
 class InputPartitionFn(Protocol):
     """Partitions the input batch."""
 
@@ -47,6 +57,17 @@ class PathAndRank(NamedTuple):
     rank: Optional[int]
 
 
+def _key_path_to_str(key_path: jax.tree_util.KeyPath) -> str:
+    """Formats a key path as a string, consistent with `tree_paths`."""
+    return "/".join(_key_entry_to_str(k) for k in key_path)
+
+
+@functools.lru_cache(maxsize=128)
+def _named_sharding(mesh: jax.sharding.Mesh, partition_spec: PartitionSpec) -> NamedSharding:
+    """Returns a NamedSharding, cached so it is built once rather than per leaf and per batch."""
+    return NamedSharding(mesh, partition_spec)
+
+
 def partition_by_path_rank(
     path_rank_to_partition: dict[PathAndRank, PartitionSpec],
 ) -> InputPartitionFn:
@@ -80,45 +101,121 @@ def partition_by_path_rank(
         })
         ```
     """
-    compiled = {}
-    for (regex, rank), spec in path_rank_to_partition.items():
-        if regex is not None:
-            regex = re.compile(regex)
-        compiled[(regex, rank)] = spec
+    # A flat tuple of (path_regex, rank, partition_spec) rules, in priority order.
+    rules = tuple(
+        (None if regex is None else re.compile(regex), rank, spec)
+        for (regex, rank), spec in path_rank_to_partition.items()
+    )
+
+    # Input batches typically have a small, fixed set of paths, so we memoize the first matching
+    # rule for each (path, rank) instead of re-running the regexes on every batch.
+    @functools.lru_cache(maxsize=1024)
+    def match(path: str, ndim: int) -> Optional[PartitionSpec]:
+        for path_regex, rank, partition_spec in rules:
+            if (rank is None or ndim == rank) and (
+                path_regex is None or path_regex.fullmatch(path)
+            ):
+                return partition_spec
+        # No rules match. We raise as not-constraining is likely an oversight.
+        raise ValueError(
+            f"No rules matched input_batch['{path}']. "
+            "If you intended to leave the input unconstrained, "
+            "specify `PartitionSpec.UNCONSTRAINED` explicitly."
+        )
+
+    # Paths for which the applied constraint has already been logged.
+    logged_paths: set[str] = set()
 
     def fn(input_batch: Nested[Tensor]) -> Nested[Tensor]:
         mesh = thread_resources.env.physical_mesh  # type: ignore
+        # Check the mesh once per batch. Leaves are then constrained with
+        # `jax.lax.with_sharding_constraint` directly, skipping the per-leaf mesh check of
+        # `utils.with_sharding_constraint`.
         if mesh.empty or mesh.size == 1:
             return input_batch
 
         def maybe_constrain(path: str, value: Tensor):
-            for (path_regex, rank), partition_spec in compiled.items():
-                if not (rank is None or value.ndim == rank) or not (
-                    path_regex is None or re.fullmatch(path_regex, path)
-                ):
-                    continue
-                if partition_spec is not PartitionSpec.UNCONSTRAINED:
-                    value = with_sharding_constraint(value, partition_spec)
-                    logging.log_first_n(
-                        logging.INFO,
-                        "Constraining input_batch[%s] with %s.",
-                        len(input_batch),
-                        path,
-                        partition_spec,
-                    )
-                return value
-            # No rules match. We raise as not-constraining is likely an oversight.
-            raise ValueError(
-                f"No rules matched input_batch['{path}']. "
-                "If you intended to leave the input unconstrained, "
-                "specify `PartitionSpec.UNCONSTRAINED` explicitly."
-            )
-
-        return jax.tree.map(maybe_constrain, tree_paths(input_batch), input_batch)
+            partition_spec = match(path, value.ndim)
+            if partition_spec is not PartitionSpec.UNCONSTRAINED:
+                # A partition spec of None (replication) is passed through as-is.
+                sharding = partition_spec
+                if partition_spec is not None:
+                    sharding = _named_sharding(mesh, partition_spec)
+                value = jax.lax.with_sharding_constraint(value, sharding)
+                if path not in logged_paths:
+                    logged_paths.add(path)
+                    logging.info("Constraining input_batch[%s] with %s.", path, partition_spec)
+            return value
+
+        # Map with key paths to avoid building a parallel tree of paths.
+        return jax.tree.map_with_path(
+            lambda key_path, value: maybe_constrain(_key_path_to_str(key_path), value),
+            input_batch,
+        )
 
     return fn
 
 
+def _prefetch(it: Iterator[_T], *, depth: int, name: str) -> Iterator[_T]:
+    """Yields the elements of `it`, produced ahead of time by a background thread.
+
+    Args:
+        it: The iterator to prefetch from.
+        depth: The maximum number of elements to buffer.
+        name: The name of the background thread.
+
+    Yields:
+        The elements of `it`, in order.
+
+    Raises:
+        Any exception raised by `it` (including e.g. `KeyboardInterrupt`), once the elements
+        preceding it have been yielded.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item: tuple[bool, object]) -> bool:
+        # Wait for space in the buffer, unless the consumer has stopped.
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce(*, context_stack: list[InvocationContext]):
+        install_context_stack(context_stack)
+        error = None
+        try:
+            for element in it:
+                if not put((False, element)):
+                    return
+        except BaseException as e:  # pylint: disable=broad-except
+            error = e
+        finally:
+            # Always mark the end, so that the consumer never blocks on an exhausted buffer.
+            put((True, error))
+
+    thread = threading.Thread(
+        name=name,
+        target=produce,
+        kwargs=dict(context_stack=clone_context_stack()),
+        daemon=True,
+    )
+    thread.start()
+    try:
+        while True:
+            done, element = buffer.get()
+            if done:
+                if element is not None:
+                    raise element
+                return
+            yield element
+    finally:
+        stopped.set()
+
+
 class Input(Module):
     """A Module to generate input batches.
 
@@ -165,6 +262,13 @@ class Input(Module):
                 per-feed batches to global batches.
             input_partitioner: If not None, applies additional sharding constraints on each input
                 batch during `dispatch_global_batch`.
+            prefetch_depth: If not None, `batches` converts up to this many batches ahead of time
+                in a background thread, overlapping host-side conversion with device compute.
+                Must be positive if set. Note that the underlying iterator is then advanced ahead
+                of the batches consumed by the caller, and concurrently with it: checkpointing
+                the iterator (e.g. the trainer saving its input iterator on the main thread)
+                races with the background thread calling `next()` on it, so prefetching should
+                not be used with checkpointed iterators.
         """
 
         # TODO(markblee): Consider allowing PartitionSpec to be a tree-prefix of the input batch,
@@ -172,10 +276,13 @@ class Input(Module):
         partition_spec: Optional[PartitionSpec] = None
         input_dispatcher: Optional[InputDispatcher.Config] = None
         input_partitioner: Optional[ConfigOr[InputPartitionFn]] = None
+        prefetch_depth: Optional[int] = None
 
     def __init__(self, cfg: Config, *, parent: Optional[Module]):
         super().__init__(cfg, parent=parent)
         cfg = self.config
+        if cfg.prefetch_depth is not None and cfg.prefetch_depth <= 0:
+            raise ValueError(f"prefetch_depth must be positive, got {cfg.prefetch_depth}.")
         self._partition_spec = cfg.partition_spec or input_partition_spec()
         if cfg.input_dispatcher is not None:
             self.input_dispatcher: BaseInputDispatcher = (
@@ -217,7 +324,21 @@ class Input(Module):
         per-feed physical batches returned from this method.
 
         See also `dispatch_global_batch` for constructing a global logical batch.
+
+        If `cfg.prefetch_depth` is not None, batches are prepared in a background thread.
         """
+        cfg = self.config
+        if cfg.prefetch_depth is not None:
+            yield from _prefetch(
+                self._physical_batches(it),
+                depth=cfg.prefetch_depth,
+                name=f"{self.path()}.prefetch",
+            )
+        else:
+            yield from self._physical_batches(it)
+
+    def _physical_batches(self, it: Iterator[Nested[Tensor]]) -> Iterator[Nested[Tensor]]:
+        """Converts batches from `it` to per-feed physical batches."""
         for input_batch in it:
             input_batch = as_numpy_array(input_batch)
             if "input_dispatcher" in self.children:
@@ -235,39 +356,44 @@ class Input(Module):
         constraining `batch_axis_names`.
         """
 
-        def constrain_batch_axis(path: str, value: Tensor):
-            mesh = thread_resources.env.physical_mesh
-            batch_partitions = math.prod(
-                mesh.shape[axis] for axis in jax.tree.leaves(self._partition_spec[0])
-            )
+        # The mesh, partition spec and number of batch partitions are the same for all leaves, so
+        # we read them into locals once rather than per leaf.
+        mesh = thread_resources.env.physical_mesh
+        partition_spec = self._partition_spec
+        batch_partitions = math.prod(
+            mesh.shape[axis] for axis in jax.tree.leaves(partition_spec[0])
+        )
+        # Sharding constraints are no-ops for trivial meshes (which also cannot be used to build a
+        # NamedSharding), so we check the mesh once rather than for every leaf.
+        trivial_mesh = mesh.empty or mesh.size == 1
+        sharding = None if trivial_mesh else _named_sharding(mesh, partition_spec)
+
+        def constrain_batch_axis(key_path: jax.tree_util.KeyPath, value: Tensor):
             # Warn if an invalid constraint is applied, since by default this can silently be
             # ignored, potentially leading to unexpected OOMs.
             if value.shape[0] % batch_partitions != 0:
                 logging.warning(
                     "Attempting to constrain path=%s (with batch dim %d) over %d partitions (%s).",
-                    path,
+                    # Only format the path when warning.
+                    _key_path_to_str(key_path),
                     value.shape[0],
                     batch_partitions,
-                    self._partition_spec,
+                    partition_spec,
                 )
-            return with_sharding_constraint(value, self._partition_spec)
+            if trivial_mesh:
+                return value
+            return jax.lax.with_sharding_constraint(value, sharding)
 
         if "input_dispatcher" in self.children:
             global_logical_batch = self.input_dispatcher.physical_to_logical_batch(
-                jax.tree.map(
-                    constrain_batch_axis,
-                    tree_paths(global_physical_batch),
-                    global_physical_batch,
-                )
+                jax.tree.map_with_path(constrain_batch_axis, global_physical_batch)
             )
         else:
             global_logical_batch = dispatch_input_batch(
-                global_physical_batch, batch_axis_names=self._partition_spec[0]
+                global_physical_batch, batch_axis_names=partition_spec[0]
             )
 
-        global_logical_batch = jax.tree.map(
-            constrain_batch_axis, tree_paths(global_logical_batch), global_logical_batch
-        )
+        global_logical_batch = jax.tree.map_with_path(constrain_batch_axis, global_logical_batch)
 
         # Further constrain based on user-configured partitioning rules.
         if self._input_partitioner is not None:
@@ -3,7 +3,7 @@
 """Tests base Input interface."""
 
 from functools import partial
-from typing import Callable, Union
+from typing import Callable, Optional, Union
 
 import jax
 import numpy as np
@@ -12,7 +12,12 @@ from absl.testing import parameterized
 from jax import numpy as jnp
 from jax.experimental.pjit import pjit
 
-from axlearn.common.input_base import Input, PathAndRank, partition_by_path_rank
+from axlearn.common.input_base import (
+    Input,
+    PathAndRank,
+    _key_path_to_str,
+    partition_by_path_rank,
+)
 from axlearn.common.input_dispatch import BaseInputDispatcher, InputDispatcher, SpmdInputDispatcher
 from axlearn.common.test_utils import TestCase
 from axlearn.common.utils import Nested, PartitionSpec, Tensor, tree_paths
@@ -104,6 +109,13 @@ class PartitionByPathAndRankTest(TestCase):
             for pattern, count in expected.items():
                 self.assertEqual(count, hlo_text.count(pattern), msg=f"{pattern=},{count=}")
 
+    def test_key_path_to_str(self):
+        tree = {"a": 1, "b": [2, {"c": 3}], "d": {"e": jnp.ones(2)}}
+        self.assertEqual(
+            tree_paths(tree),
+            jax.tree.map_with_path(lambda key_path, _: _key_path_to_str(key_path), tree),
+        )
+
 
 def dispatch_and_check_sharding(
     cfg: Input.Config,
@@ -228,3 +240,49 @@ class InputTest(TestCase):
             self.assertNestedEqual(
                 expected, ds.input_dispatcher.logical_to_physical_shapes(element_spec)
             )
+
+    @parameterized.parameters(None, 1, 3)
+    def test_batches(self, prefetch_depth: Optional[int]):
+        input_cfg: Input.Config = Input.default_config().set(
+            name="test",
+            partition_spec=PartitionSpec("data"),
+            prefetch_depth=prefetch_depth,
+        )
+        ds: Input = input_cfg.instantiate(parent=None)
+
+        input_batches = [{"x": jnp.full((2, 3), i)} for i in range(5)]
+        output_batches = list(ds.batches(iter(input_batches)))
+        self.assertEqual(len(input_batches), len(output_batches))
+        for input_batch, output_batch in zip(input_batches, output_batches):
+            self.assertIsInstance(output_batch["x"], np.ndarray)
+            self.assertNestedEqual(input_batch, output_batch)
+
+    @parameterized.parameters(0, -1)
+    def test_batches_invalid_prefetch_depth(self, prefetch_depth: int):
+        input_cfg: Input.Config = Input.default_config().set(
+            name="test",
+            partition_spec=PartitionSpec("data"),
+            prefetch_depth=prefetch_depth,
+        )
+        with self.assertRaisesRegex(ValueError, "prefetch_depth must be positive"):
+            input_cfg.instantiate(parent=None)
+
+    # SystemExit is a BaseException, but not an Exception.
+    @parameterized.parameters(ValueError, SystemExit)
+    def test_batches_prefetch_error(self, error_type: type[BaseException]):
+        input_cfg: Input.Config = Input.default_config().set(
+            name="test",
+            partition_spec=PartitionSpec("data"),
+            prefetch_depth=2,
+        )
+        ds: Input = input_cfg.instantiate(parent=None)
+
+        def input_batches():
+            yield {"x": np.ones((2, 3))}
+            raise error_type("Failed to read input.")
+
+        it = ds.batches(input_batches())
+        self.assertNestedEqual({"x": np.ones((2, 3))}, next(it))
+        # Errors in the background thread are raised to the caller.
+        with self.assertRaisesRegex(error_type, "Failed to read input."):
+            next(it)